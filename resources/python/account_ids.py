@@ -1,7 +1,8 @@
-import copy
+import functools
 import logging
 import time
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Dict
 
 import boto3
@@ -9,10 +10,50 @@ from botocore.config import Config
 import yaml as yml
 from mypy_boto3_organizations import OrganizationsClient
 
+try:
+    # Use the libyaml backed loader when PyYAML has been built with it, as it is considerably faster
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
+
 YAML_FILE_NAME = "customizations-terraform.yaml"
 DEBUG_YAML_FILE_NAME = "debugging_files/test-customizations-terraform.yaml"
 NAME_OF_OU_ROOT = "root"
-ALL_REGIONS = set()
+# Kept low to stay within the AWS Organizations API request rate quota
+MAX_ORG_API_WORKERS = 10
+# The largest page size the AWS Organizations list operations allow, to keep the number of API round trips down
+ORG_API_PAGINATION_CONFIG = {'PageSize': 20}
+MAX_FILE_WRITE_WORKERS = 8
+
+# Terraform code templates, filled in with str.format by the code generating functions below
+MANAGEMENT_PROVIDER_TEMPLATE = (
+    'provider "aws" {{\n'
+    '  region = "{region}"\n'
+    '}}\n'
+    '\n'
+)
+PROVIDER_TEMPLATE = (
+    'provider "aws" {{\n'
+    '  assume_role {{\n'
+    '    role_arn = "{role_arn}"\n'
+    '  }}\n'
+    '  alias  = "{region}-{account_name}"\n'
+    '  region = "{region}"\n'
+    '}}\n'
+    '\n'
+)
+MODULE_HEADER_TEMPLATE = (
+    'module "{module_name}-{region}-{account_name}" {{\n'
+    '  source = "{module_source}"\n'
+)
+MODULE_VARIABLE_TEMPLATE = '  {name} = '
+MODULE_PROVIDERS_TEMPLATE = (
+    '  providers = {{\n'
+    '    aws = aws.{region}-{account_name}\n'
+    '    }}\n'
+)
+MODULE_DEPENDS_ON_TEMPLATE = '  depends_on = [ {depends_on} ]\n'
+MODULE_FOOTER = '}\n\n'
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s - \"%(funcName)s\" - %(message)s")
@@ -23,13 +64,15 @@ def load_configuration(yaml_file_name: str) -> dict:
     Loads the yaml file containing the config for the tf module deployment
 
     :param yaml_file_name: File name it could contain a path for the file, if in debug mode
-    :return: Returns the yaml as a dict
+    :return: Returns the yaml as a dict, which is empty if the file has no yaml content
     """
     logger.info(f"Attempting to load '{yaml_file_name}'...")
     with open(f'{yaml_file_name}', 'r', encoding='us-ascii') as file:
-        docs = yml.safe_load_all(file)
-        for doc in docs:
-            yaml = doc
+        docs = list(yml.load_all(file, Loader=YamlSafeLoader))
+    if len(docs) > 1:
+        logger.warning(f"'{yaml_file_name}' contains {len(docs)} yaml documents, only the first will be used.")
+    # A file with no documents (e.g. only comments) or an empty document is treated as a config with no modules
+    yaml = (docs[0] if docs else None) or {}
     logger.info(f"'{yaml_file_name}' loaded.")
     logger.debug(f"Yaml returned: {yaml}")
     return yaml
@@ -55,17 +98,19 @@ def get_all_accounts(org_client: OrganizationsClient) -> dict:
     """
     Gets all account IDs in the organization.
     """
-    accounts = {}
     paginator = org_client.get_paginator('list_accounts')
-    for page in paginator.paginate():
-        for account in page['Accounts']:
-            accounts[account.get("Name")] = account.get("Id")
-    return accounts
+    return {
+        account.get("Name"): account.get("Id")
+        for page in paginator.paginate(PaginationConfig=ORG_API_PAGINATION_CONFIG)
+        for account in page['Accounts']
+    }
 
 
+@functools.cache
 def get_all_regions() -> list:
     """
-    Gets all AWS regions. You may want to customize this based on your needs.
+    Gets all AWS regions. You may want to customize this based on your needs. The result is cached, so the ec2 client
+    is only created and called once.
     """
     ec2_client = boto3.client('ec2')
     regions = [region['RegionName'] for region in ec2_client.describe_regions()['Regions']]
@@ -73,108 +118,162 @@ def get_all_regions() -> list:
     return regions
 
 
-def get_all_accounts_recursive(org_client: OrganizationsClient, parent_id: str, name: str,
-                               accounts_by_ou: dict) -> dict:
+def get_ou_accounts_and_children(org_client: OrganizationsClient, parent_id: str, name: str) -> tuple:
     """
-    Recursive function that builds out a dict containing an entire org's accounts by their parent OU.
+    Gets the accounts directly under an OU, along with the child OUs that still need to be visited.
 
     Args:
         org_client: Object representing the aws organizations client.
-        parent_id: ID of parent OU to the child OU
+        parent_id: ID of the OU
         name: OU by its name ("Workloads/Dev")
-        accounts_by_ou: the dict containing accounts by OU that is progressively built via recursion. E.g:
-        {'root': [{'Id': '123', 'Arn': 'arn:...', '...': '...'}, {...}], 'SharedServices': [{...}, {...}], '...': [{'...'}]}
 
     Returns:
-        Returns the accounts_by_ou
+        Tuple of (name, accounts, children), where accounts is a dict of account ids by account name and children is
+        a list of (child_id, child_name) pairs
     """
     accounts_paginator = org_client.get_paginator('list_accounts_for_parent')
     ou_paginator = org_client.get_paginator('list_organizational_units_for_parent')
-    accounts = []
+    accounts = {}
+    children = []
 
-    for page in accounts_paginator.paginate(ParentId=parent_id):
-        accounts += page['Accounts']
+    # Organizations has no call that returns every account along with its parent, so listing the accounts per OU here
+    # (one paginated call per OU) is cheaper than one list_accounts call followed by a list_parents call per account
+    for page in accounts_paginator.paginate(ParentId=parent_id, PaginationConfig=ORG_API_PAGINATION_CONFIG):
+        accounts.update((account.get("Name"), account.get("Id")) for account in page['Accounts'])
 
-    accounts_by_ou[name] = accounts
-    for page in ou_paginator.paginate(ParentId=parent_id):
+    for page in ou_paginator.paginate(ParentId=parent_id, PaginationConfig=ORG_API_PAGINATION_CONFIG):
         for ou in page['OrganizationalUnits']:
-            if name == NAME_OF_OU_ROOT:
-                ou_name = ou['Name']
-            elif org_client.list_children(ParentId=parent_id, ChildType='ORGANIZATIONAL_UNIT')["Children"]:
-                ou_name = f"{name}/{ou['Name']}"
-            get_all_accounts_recursive(
-                org_client=org_client,
-                parent_id=ou['Id'],
-                name=ou_name,
-                accounts_by_ou=accounts_by_ou
-            )
+            ou_name = ou['Name'] if name == NAME_OF_OU_ROOT else f"{name}/{ou['Name']}"
+            children.append((ou['Id'], ou_name))
+
+    return name, accounts, children
+
+
+def get_all_accounts_recursive(org_client: OrganizationsClient, parent_id: str, name: str,
+                               accounts_by_ou: dict) -> dict:
+    """
+    Builds out a dict containing an entire org's accounts by their parent OU. Each OU is fetched on a thread pool, and
+    its child OUs are submitted as soon as it completes, so sibling branches of the tree are walked concurrently. Once
+    the walk is done, the OUs are added to accounts_by_ou in depth first tree order, so the result does not depend on
+    the order the API calls completed in.
+
+    Args:
+        org_client: Object representing the aws organizations client.
+        parent_id: ID of the OU to start the walk from
+        name: OU by its name ("Workloads/Dev")
+        accounts_by_ou: the dict containing account ids by name, by OU, that is progressively built during the walk.
+        E.g: {'root': {'Management': '123...', 'Audit': '...'}, 'SharedServices': {'SharedServices': '...'}, '...': {}}
+
+    Returns:
+        Returns the accounts_by_ou
+    """
+    accounts_by_name = {}
+    child_names_by_name = {}
+    with ThreadPoolExecutor(max_workers=MAX_ORG_API_WORKERS) as executor:
+        in_flight = {executor.submit(get_ou_accounts_and_children, org_client, parent_id, name)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                ou_name, accounts, children = future.result()
+                accounts_by_name[ou_name] = accounts
+                child_names_by_name[ou_name] = [child_name for _, child_name in children]
+                for child_id, child_name in children:
+                    in_flight.add(executor.submit(get_ou_accounts_and_children, org_client, child_id, child_name))
+
+    # Add the OUs in the same order a sequential depth first walk would have visited them
+    stack = [name]
+    while stack:
+        ou_name = stack.pop()
+        accounts_by_ou[ou_name] = accounts_by_name[ou_name]
+        stack.extend(reversed(child_names_by_name[ou_name]))
 
     return accounts_by_ou
 
 
 def filter_excluded_accounts(org_account_list: dict, excluded_accounts: list) -> dict:
     """
-    Rebuilds the org_account_list dict with "excluded_accounts" no longer present. As this dict is what is used to find
-    accounts, it is an effective way to ignore excluded accounts.
+    Builds a copy of the org_account_list dict with "excluded_accounts" no longer present. As this dict is what is used
+    to find accounts, it is an effective way to ignore excluded accounts. The org_account_list param is not modified.
 
     Args:
-        org_account_list: dictionary of accounts (with their details) by OU e.g. :
-        {'root': [{'Id': '123', 'Arn': 'arn:...', '...': '...'}, {...}], 'SharedServices': [{...}, {...}], '...': [{'...'}]}
+        org_account_list: dictionary of account ids by name, by OU e.g. :
+        {'root': {'Management': '123...', 'Audit': '...'}, 'SharedServices': {'SharedServices': '...'}, '...': {}}
         excluded_accounts: List of accounts to be excluded by their name e.g. ['TestWorkload', 'Workloads/Pre']
 
     Returns:
-        Returns rebuilt param "org_account_list" with excluded accounts no longer present.
+        Returns a filtered copy of param "org_account_list" with excluded accounts no longer present.
     """
-    for ou, account in org_account_list.items():
-        org_account_list[ou] = [
-            acc for acc in account if not (
-                    ou in excluded_accounts or acc.get("Name") in excluded_accounts
-            )
-        ]
-    return org_account_list
+    excluded = set(excluded_accounts)
+    return {
+        ou: {} if ou in excluded else {name: id_ for name, id_ in accounts.items() if name not in excluded}
+        for ou, accounts in org_account_list.items()
+    }
 
 
 def account_ids_from_ou(ou_target_accounts: list, ou_with_all_accounts: dict) -> Dict[str, int]:
     """
-    Gets all accounts from ou_with_all_accounts based on the OU names in ou_target_accounts.
+    Gets all accounts from ou_with_all_accounts based on the OU names in ou_target_accounts. OU names that are not
+    found are logged as a warning and skipped. Excluded OUs are still present (with no accounts), so an OU that is not
+    found is most likely a typo in the yaml.
 
     Args:
         ou_target_accounts: list of OU names e.g. ['SharedServices', 'Workloads/Dev']
-        ou_with_all_accounts: dictionary of accounts (with their details) by OU e.g.:
-        {'root': [{'Id': '123', 'Arn': 'arn:...', '...': '...'}, {...}],
-        'SharedServices': [{...}, {...}], '...': [{'...'}]}
+        ou_with_all_accounts: dictionary of account ids by name, by OU e.g.:
+        {'root': {'Management': '123...', 'Audit': '...'}, 'SharedServices': {'SharedServices': '...'}, '...': {}}
 
     Returns:
         Dict in the format [str, int] of the found account IDs that need to be included as part of deployment
     """
+    unknown_ous = [ou for ou in ou_target_accounts if ou not in ou_with_all_accounts]
+    if unknown_ous:
+        logger.warning(f"OUs not found in the organization, no accounts will be targeted for them: {unknown_ous}")
+
     accounts = {}
     for ou in ou_target_accounts:
-        for account_data in ou_with_all_accounts.get(ou):
-            accounts[account_data.get("Name")] = account_data.get("Id")
+        accounts.update(ou_with_all_accounts.get(ou, {}))
     return accounts
 
 
-def account_ids_from_name(deployment_target_accounts: list, ou_org_accounts: dict) -> Dict[str, int]:
+def account_ids_from_name(deployment_target_accounts: list, account_ids_by_name: Dict[str, int]) -> Dict[str, int]:
     """
-    Converts the name of an account to its account ID. This is achieved by finding the name in the "ou_org_accounts"
-    param.
+    Converts the name of an account to its account ID. This is achieved by looking the name up in the
+    "account_ids_by_name" param. Names that are not found (e.g. excluded accounts) are skipped.
 
     Args:
         deployment_target_accounts: list of account names by word e.g. ['Management', 'TestWorkload']
-        ou_org_accounts: dictionary of accounts (with their details) by OU e.g. :
-        {'root': [{'Id': '123', 'Arn': 'arn:...', '...': '...'}, {...}], 'SharedServices': [{...}, {...}], '...': [{'...'}]}
+        account_ids_by_name: dictionary of account ids by account name e.g. {'Management': '123...', 'Audit': '...'}
 
     Returns:
         Dict in the format [str, int] of the found account IDs that need to be included as part of deployment
     """
-    deployment_accounts = {}
-    for ou in ou_org_accounts:
-        for account in ou_org_accounts[ou]:
-            account_name = account.get("Name")
-            if account_name in deployment_target_accounts:
-                deployment_target_accounts.remove(account_name)
-                deployment_accounts[account_name] = account.get("Id")
-    return deployment_accounts
+    return {
+        account_name: account_ids_by_name[account_name]
+        for account_name in deployment_target_accounts
+        if account_name in account_ids_by_name
+    }
+
+
+def _ou_target_account_ids(targets: list, ou_with_all_accounts: dict, _: Dict[str, int]) -> Dict[str, int]:
+    """
+    Deployment target handler for "organizationalUnits", see TARGET_HANDLERS.
+    """
+    return account_ids_from_ou(ou_target_accounts=targets, ou_with_all_accounts=ou_with_all_accounts)
+
+
+def _named_target_account_ids(targets: list, _: dict, account_ids_by_name: Dict[str, int]) -> Dict[str, int]:
+    """
+    Deployment target handler for "accounts", see TARGET_HANDLERS.
+    """
+    return account_ids_from_name(deployment_target_accounts=targets, account_ids_by_name=account_ids_by_name)
+
+
+# Functions that get the account ids for each kind of deployment target, by the target's key in the yaml. Each is
+# called with the target's list from the yaml, the (filtered) accounts by OU, and the (filtered) account ids by name,
+# and ignores whichever of the last two it does not need. Keys without a handler (e.g. "excludedAccounts") are skipped.
+TARGET_HANDLERS = {
+    "organizationalUnits": _ou_target_account_ids,
+    "accounts": _named_target_account_ids,
+}
 
 
 def create_backend_code():
@@ -198,7 +297,7 @@ def create_backend_code():
 
 def create_provider_code(regions: list, account_ids_by_name: Dict[str, int]) -> str:
     """
-    Generates Terraform provider blocks for modules to use
+    Generates Terraform provider blocks for modules to use. The code is returned rather than written, see write_files.
 
     Args:
         :param regions: List of regions
@@ -208,33 +307,23 @@ def create_provider_code(regions: list, account_ids_by_name: Dict[str, int]) ->
     # Management account id excluded below as no provider block for this account is required. This is as the account
     # the terraform pipeline is run in, is the management account.
 
-    # Initialize empty string to store code
-    provider_code_string_builder = ""
+    role_arns_by_name = {
+        account_name: f"arn:aws:iam::{account_id}:role/OrganizationAccountAccessRole"
+        for account_name, account_id in account_ids_by_name.items()
+    }
+
+    # Collect code fragments and join them once at the end
+    provider_code_parts: list[str] = []
     for region in regions:
-        for account_name, account_id in account_ids_by_name.items():
+        for account_name, role_arn in role_arns_by_name.items():
             if account_name == "Management":
-                provider_code_string_builder += "provider \"aws\" {\n"
-                provider_code_string_builder += f"  region = \"{region}\"\n"
-                provider_code_string_builder += "}\n"
-                provider_code_string_builder += "\n"
+                provider_code_parts.append(MANAGEMENT_PROVIDER_TEMPLATE.format(region=region))
                 continue
-            account_name = account_name.lower()
-            # Add provider declaration
-            provider_code_string_builder += "provider \"aws\" {\n"
-            provider_code_string_builder += "  assume_role {\n"
-            # Role that can be assumed by the Management account
-            provider_code_string_builder += f"    role_arn = \"arn:aws:iam::{account_id}:role/OrganizationAccountAccessRole\"\n"
-            provider_code_string_builder += "  }\n"
-            provider_code_string_builder += f"  alias  = \"{region}-{account_name}\"\n"
-            provider_code_string_builder += f"  region = \"{region}\"\n"
-            provider_code_string_builder += "}\n"
-            provider_code_string_builder += "\n"
-
-    write_to_file(
-        content=provider_code_string_builder,
-        output_file="terraform/provider.tf"
-    )
-    return provider_code_string_builder
+            # Add provider declaration, using the role that can be assumed by the Management account
+            provider_code_parts.append(
+                PROVIDER_TEMPLATE.format(role_arn=role_arn, region=region, account_name=account_name.lower())
+            )
+    return "".join(provider_code_parts)
 
 
 def create_empty_main_tf() -> None:
@@ -260,101 +349,145 @@ def create_module_code(module_name: str, module_source: str, deployment_account_
         module_dependencies: List of dependencies for the module.
 
     Returns:
-        A string containing the generated Terraform module code.
+        A string containing the generated Terraform module code. It is not written to file, see write_files.
     """
     logger.info(f"Attempting to generate terraform file for {module_name}")
 
-    # Initialize empty string to store code
-    module_code = ""
+    # Variables are the same for every region and account, so they are only formatted once
+    variable_parts: list[str] = []
+    for var in variables or []:
+        variable_parts.append(MODULE_VARIABLE_TEMPLATE.format(name=var.get("name")))
+        format_value(var.get("value"), variable_parts)
+        variable_parts.append("\n")
+    variables_code = "".join(variable_parts)
+    if not variables_code:
+        logger.info(f"No variables specified for the '{module_name}'.")
+
+    # Collect code fragments and join them once at the end
+    module_code_parts: list[str] = []
+
+    # Account names are lowered once here, rather than once per region
+    account_names = [account_name.lower() for account_name in deployment_account_ids]
 
     for region in regions:
-        for account_name, account_id in deployment_account_ids.items():
-            account_name = account_name.lower()
+        # The depends_on line only varies by region, so it is built once per region rather than once per account
+        depends_on_code = ""
+        if module_dependencies:
+            depends_on = ", ".join(f"module.{dependent}-{region}" for dependent in module_dependencies)
+            depends_on_code = MODULE_DEPENDS_ON_TEMPLATE.format(depends_on=depends_on)
+
+        for account_name in account_names:
             # Add module declaration
-            module_code += f"module \"{module_name}-{region}-{account_name}\" {{\n"
-            module_code += f"  source = \"{module_source}\"\n"
+            module_code_parts.append(MODULE_HEADER_TEMPLATE.format(
+                module_name=module_name,
+                region=region,
+                account_name=account_name,
+                module_source=module_source
+            ))
             # Handle variables for the module
-            if variables:
-                for var in variables:
-                    name = var.get("name")
-                    value = var.get("value")
-                    formatted_value = format_value(value)
-                    module_code += f"  {name} = {formatted_value}\n"
-            else:
-                logger.info(f"No variables specified for the '{module_name}'.")
+            module_code_parts.append(variables_code)
             # Add provider configuration
             if account_name != "management":
-                module_code += f"  providers = {{\n    aws = aws.{region}-{account_name}\n    }}\n"
+                module_code_parts.append(MODULE_PROVIDERS_TEMPLATE.format(region=region, account_name=account_name))
 
             # Add depends_on configuration
-            dependencies = module_dependencies
-            if dependencies:
-                module_code += "  depends_on = [ "
-                for dependent in dependencies:
-                    module_code += f"module.{dependent}-{region}, "
-                module_code = module_code[:-2] + " ]\n"
-
-            module_code += "}\n"
-            module_code += "\n"
-    write_to_file(
-        content=module_code,
-        output_file=f"terraform/{module_name}.tf"
-    )
-    return module_code
+            module_code_parts.append(depends_on_code)
 
+            module_code_parts.append(MODULE_FOOTER)
+    return "".join(module_code_parts)
 
-def format_value(value, indent=0):
+
+def format_value(value, parts: list[str], indent: int = 0) -> None:
     """
-    Recursively formats the value based on its type (string, bool, int, list, or dict).
+    Formats the value based on its type (string, bool, int, list, or dict). Nested lists and dicts are walked using an
+    explicit stack of pending work rather than recursion. Each stack entry is either a literal string to emit, or a
+    (value, indent) tuple still to be formatted. The formatted fragments are appended straight to the caller's "parts"
+    list, so no intermediate strings are built for nested values.
 
     Args:
         value: The value to be formatted.
+        parts: List that the fragments of the value, formatted in the correct way for terraform, are appended to.
         indent: Number of tabs to include to format the terraform
-    Returns:
-        The values formatted in the correct way for terraform.
     """
+    stack = [(value, indent)]
 
-    indent_space = '  ' * indent
-
-    if isinstance(value, str):
-        if value.startswith("module."):
-            return value  # No quotes for module references
-        return f"\"{value}\""  # String with quotes if conversion fails
-
-    elif isinstance(value, bool):
-        return str(value).lower()
-
-    elif isinstance(value, int):
-        return value
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
 
-    elif isinstance(value, list):
-        if all(not isinstance(v, (dict, list)) for v in value):
-            # Flat list
+        value, indent = item
+        if isinstance(value, list):
             indent += 1
             indent_space = '  ' * indent
-            inner = ", ".join(format_value(v, indent) for v in value)
-            return f"[{inner}]"
-        else:
-            # Complex list, format with indentation
+            if all(not isinstance(v, (dict, list)) for v in value):
+                # Flat list
+                pending = ["["]
+                for i, v in enumerate(value):
+                    if i:
+                        pending.append(", ")
+                    pending.append((v, indent))
+                pending.append("]")
+            else:
+                # Complex list, format with indentation
+                pending = ["[\n"]
+                for i, v in enumerate(value):
+                    if i:
+                        pending.append(",\n")
+                    pending.append(f"{indent_space}  ")
+                    pending.append((v, indent))
+                pending.append(f"\n{indent_space}]")
+            stack.extend(reversed(pending))
+
+        elif isinstance(value, dict):
             indent += 1
             indent_space = '  ' * indent
-            inner = ",\n".join(f"{indent_space}  {format_value(v, indent)}" for v in value)
-            return f"[\n{inner}\n{indent_space}]"
+            pending = ["{\n"]
+            for i, (k, v) in enumerate(value.items()):
+                if i:
+                    pending.append("\n")
+                pending.append(f"{indent_space}  {k} = ")
+                pending.append((v, indent))
+            pending.append(f"\n{indent_space}}}")
+            stack.extend(reversed(pending))
+
+        # bool is a subclass of int, so is covered here too
+        elif isinstance(value, (str, int)):
+            parts.append(_format_scalar(value))
 
-    elif isinstance(value, dict):
-        indent += 1
-        indent_space = '  ' * indent
-        inner = "\n".join(f"{indent_space}  {k} = {format_value(v, indent)}" for k, v in value.items())
-        return f"{{\n{inner}\n{indent_space}}}"
+        else:
+            raise TypeError(f"Unsupported type: {type(value)}, Value: {value}")
 
-    else:
-        raise TypeError(f"Unsupported type: {type(value)}, Value: {value}")
-    return value
+
+# typed=True so that True and 1, which are equal and hash the same, are cached separately
+@functools.lru_cache(maxsize=4096, typed=True)
+def _format_scalar(value) -> str:
+    """
+    Formats a string, bool or int value for terraform. The same values tend to repeat across variables and modules, so
+    the results are cached. format_value checks the type before calling this, so unhashable values never reach the
+    cache.
+
+    Args:
+        value: The value to be formatted.
+    Returns:
+        The value formatted in the correct way for terraform.
+    """
+    if isinstance(value, str):
+        if value.startswith("module."):
+            return value  # No quotes for module references
+        return f"\"{value}\""
+
+    if isinstance(value, bool):
+        return str(value).lower()
+
+    return str(value)
 
 
 def write_to_file(content, output_file):
     """
-    Writes content to a specified file.
+    Writes content to a specified file. If the file already holds exactly this content it is left untouched, so its
+    modification time only changes when its content does.
 
     Args:
         content: The content to be written to the file (string).
@@ -363,9 +496,16 @@ def write_to_file(content, output_file):
     # Get the directory path from the output_file
     directory = os.path.dirname(output_file)
 
-    # Check if directory exists, create it if not (using os.makedirs for recursive creation)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    # Create the directory if it doesn't exist (using os.makedirs for recursive creation)
+    os.makedirs(directory or ".", exist_ok=True)
+
+    try:
+        with open(output_file, "r", encoding='us-ascii') as file:
+            if file.read() == content:
+                logger.info(f"Content unchanged, skipped writing: {output_file}")
+                return
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
 
     with open(output_file, "w", encoding='us-ascii') as file:
         file.write(content)
@@ -374,6 +514,18 @@ def write_to_file(content, output_file):
     return
 
 
+def write_files(files: Dict[str, str]) -> None:
+    """
+    Writes all generated files in a single pass, on a thread pool so the writes can overlap.
+
+    Args:
+        files: dict of file content by output file path e.g. {'terraform/provider.tf': 'provider "aws" {...'}
+    """
+    with ThreadPoolExecutor(max_workers=MAX_FILE_WRITE_WORKERS) as executor:
+        # Consume the results so that any exception raised by a write is surfaced here
+        list(executor.map(write_to_file, files.values(), files.keys()))
+
+
 def deploy_targets(org_client: OrganizationsClient, tf_modules: dict, root_id: str):
     """
     This function is the backbone of the script. It creates the dictionary containing all accounts by Org Unit of the
@@ -404,15 +556,18 @@ def deploy_targets(org_client: OrganizationsClient, tf_modules: dict, root_id: s
     )
     end_timer = time.time()
     logger.info(f"Build complete. The build took {end_timer - start_timer} seconds to complete.")
-    for key, value in ou_with_all_accounts.items():
-        if isinstance(value, list):
-            for account in value:
-                account_ids_by_name[account.get("Name")] = account.get("Id")
+    for accounts in ou_with_all_accounts.values():
+        account_ids_by_name.update(accounts)
+
+    # Sorted, as set order varies between runs (string hashing is randomized), and provider.tf should be stable so that
+    # it is only rewritten when its content changes
+    all_regions = sorted(set().union(*(tf_module.get("regions") or [] for tf_module in tf_modules)))
 
-    logger.info("Attempting to build list of all modules being deployed")
-    all_modules = []
-    for module in tf_modules:
-        all_modules.append(module.get('name'))
+    logger.info("Attempting to build set of all modules being deployed")
+    all_module_names = frozenset(module.get('name') for module in tf_modules)
+
+    # Generated code by output file path, written together once every module has been generated
+    output_files = {}
 
     for tf_module in tf_modules:
         deployment_target_accounts = {}
@@ -420,11 +575,10 @@ def deploy_targets(org_client: OrganizationsClient, tf_modules: dict, root_id: s
         module_name = tf_module.get("name")
         module_source = tf_module.get("source")
         regions = tf_module.get("regions")
-        for region in regions:
-            ALL_REGIONS.add(region)
         variable_inputs = tf_module.get("variables")
         dependencies = tf_module.get("dependsOn")
-        all_org_accounts_copy = copy.deepcopy(ou_with_all_accounts)
+        all_org_accounts = ou_with_all_accounts
+        target_account_ids_by_name = account_ids_by_name
         logger.info(f"Building pipeline deployment for module: '{module_name}'")
 
         if "excludedAccounts" in deployment_target:
@@ -432,10 +586,15 @@ def deploy_targets(org_client: OrganizationsClient, tf_modules: dict, root_id: s
             excluded_accounts = deployment_target.get("excludedAccounts", [])
             if excluded_accounts:
                 try:
-                    all_org_accounts_copy = filter_excluded_accounts(
+                    all_org_accounts = filter_excluded_accounts(
                         org_account_list=ou_with_all_accounts,
                         excluded_accounts=excluded_accounts
                     )
+                    target_account_ids_by_name = {
+                        account_name: account_id
+                        for accounts in all_org_accounts.values()
+                        for account_name, account_id in accounts.items()
+                    }
                 except Exception as e:
                     return logger.exception(f"Failed to filter excluded accounts due to : '{e}'")
             else:
@@ -445,54 +604,30 @@ def deploy_targets(org_client: OrganizationsClient, tf_modules: dict, root_id: s
                 )
             logger.info("Excluding accounts step complete.")
 
+        # Targets are handled in the order they appear in the yaml, which sets the order of the generated module blocks
         for target in deployment_target:
-            match target:
-                case "organizationalUnits":
-                    ou_target_accounts = deployment_target.get("organizationalUnits")
-                    if ou_target_accounts:
-                        try:
-                            deployment_target_accounts.update(
-                                account_ids_from_ou(
-                                    ou_target_accounts=ou_target_accounts,
-                                    ou_with_all_accounts=all_org_accounts_copy
-                                )
-                            )
-                        except Exception as e:
-                            return logger.exception(f"Failed to filter excluded accounts due to : '{e}'")
-                    else:
-                        logger.warning(
-                            f"'organizationalUnits' defined in yaml for the tf module '{module_name}' without any OUs, "
-                            f"consider removing if not required."
-                        )
-                case "accounts":
-                    account_targets = deployment_target.get("accounts")
-                    if account_targets:
-                        deployment_target_accounts.update(
-                            account_ids_from_name(
-                                deployment_target_accounts=account_targets,
-                                ou_org_accounts=all_org_accounts_copy
-                            )
-                        )
-                    else:
-                        logger.warning(
-                            f"'accounts' defined in yaml for the tf module '{module_name}' without any accounts, "
-                            f"consider removing if not required."
-                        )
-        if dependencies:
-            for dependent in dependencies:
-                try:
-                    if dependent not in all_modules:
-                        raise Exception(
-                            f"dependencies defined in the yaml for tf module '{module_name}' which don't exist")
-                except Exception as e:
-                    return logger.exception(f"'{e}'")
+            get_target_account_ids = TARGET_HANDLERS.get(target)
+            if get_target_account_ids is None:
+                continue
+            targets = deployment_target.get(target)
+            if targets:
+                deployment_target_accounts.update(
+                    get_target_account_ids(targets, all_org_accounts, target_account_ids_by_name)
+                )
+            else:
+                logger.warning(
+                    f"'{target}' defined in yaml for the tf module '{module_name}' without any targets, "
+                    f"consider removing if not required."
+                )
+        missing_dependencies = set(dependencies or ()) - all_module_names
+        if missing_dependencies:
+            return logger.error(
+                f"dependencies defined in the yaml for tf module '{module_name}' which don't exist: "
+                f"{sorted(missing_dependencies)}"
+            )
 
         logger.info(f"Accounts to deploy to for module {module_name}: {deployment_target_accounts}")
-        create_provider_code(
-            account_ids_by_name=account_ids_by_name,
-            regions=ALL_REGIONS
-        )
-        create_module_code(
+        output_files[f"terraform/{module_name}.tf"] = create_module_code(
             module_name=module_name,
             module_source=module_source,
             deployment_account_ids=deployment_target_accounts,
@@ -500,6 +635,12 @@ def deploy_targets(org_client: OrganizationsClient, tf_modules: dict, root_id: s
             variables=variable_inputs,
             module_dependencies=dependencies
         )
+
+    output_files["terraform/provider.tf"] = create_provider_code(
+        account_ids_by_name=account_ids_by_name,
+        regions=all_regions
+    )
+    write_files(output_files)
     return
 
 
@@ -513,7 +654,7 @@ def main(test_debug_mode=False) -> None:
     boto_org_config = Config(
         retries={
             'max_attempts': 10,
-            'mode': 'standard'
+            'mode': 'adaptive'
         }
     )
     org_client = boto3.client(
@@ -521,7 +662,6 @@ def main(test_debug_mode=False) -> None:
         config=boto_org_config
     )
     tf_modules = tf_config_template.get("terraformModules")
-    org_root_id = get_root_id(org_client=org_client)
 
     create_backend_code()
 
@@ -530,13 +670,18 @@ def main(test_debug_mode=False) -> None:
         # Get all accounts and regions from the organization
         all_accounts = get_all_accounts(org_client=org_client)
         all_regions = get_all_regions()
-        create_provider_code(
-            account_ids_by_name=all_accounts,
-            regions=all_regions
+        write_to_file(
+            content=create_provider_code(
+                account_ids_by_name=all_accounts,
+                regions=all_regions
+            ),
+            output_file="terraform/provider.tf"
         )
         create_empty_main_tf()
         return
 
+    # The root id is only needed to start the OU walk, so it is not fetched when there are no modules
+    org_root_id = get_root_id(org_client=org_client)
     deploy_targets(
         org_client=org_client,
         tf_modules=tf_modules,
@@ -1,5 +1,7 @@
 import json
 import os
+import time
+import pytest
 from .. import account_ids
 from unittest.mock import Mock, patch
 TEST_DIRECTORY_PATH = "test_data/"
@@ -26,6 +28,29 @@ def load_file_from_path(file_name_with_ext, is_json_file=False, is_text_file=Fal
         return e
 
 
+def mock_org_client_for_tree(accounts_by_parent, ous_by_parent, delays_by_parent=None):
+    """
+    Builds a mock organizations client for the OU walk. Each parent's accounts call sleeps for its delay (in seconds)
+    in delays_by_parent, so the order the calls complete in can be controlled.
+    """
+    def paginate_accounts(ParentId, PaginationConfig):
+        time.sleep((delays_by_parent or {}).get(ParentId, 0))
+        return iter([{'Accounts': accounts_by_parent[ParentId]}])
+
+    mock_accounts_paginator = Mock()
+    mock_accounts_paginator.paginate.side_effect = paginate_accounts
+    mock_ou_paginator = Mock()
+    mock_ou_paginator.paginate.side_effect = lambda ParentId, PaginationConfig: iter(
+        [{'OrganizationalUnits': ous_by_parent[ParentId]}]
+    )
+    mock_org_client = Mock()
+    mock_org_client.get_paginator.side_effect = lambda operation_name: {
+        'list_accounts_for_parent': mock_accounts_paginator,
+        'list_organizational_units_for_parent': mock_ou_paginator
+    }[operation_name]
+    return mock_org_client
+
+
 def test_single_account_id_from_ou():
     ou_target_account = ['Workloads/Pro']
     ou_with_all_accounts = load_file_from_path(
@@ -52,15 +77,28 @@ def test_multi_account_id_from_ou():
     assert actual_output == {"TestProdWorkload": '777777777777', 'TestWorkload': '666666666666'}
 
 
+def test_account_id_from_ou_not_found(caplog):
+    actual_output = account_ids.account_ids_from_ou(
+        ou_target_accounts=['Workloads/Missing', 'Workloads/Pro'],
+        ou_with_all_accounts={'Workloads/Pro': {'TestProdWorkload': '777777777777'}}
+    )
+    assert actual_output == {"TestProdWorkload": '777777777777'}
+    assert [record.levelname for record in caplog.records] == ["WARNING"]
+    assert "['Workloads/Missing']" in caplog.records[0].getMessage()
+
+
 def test_single_account_id_from_name():
     deployment_target_accounts = ["Audit"]
     ou_with_all_accounts = load_file_from_path(
         file_name_with_ext="ou_with_all_accounts.json",
         is_json_file=True
     )
+    account_ids_by_name = {
+        name: account_id for accounts in ou_with_all_accounts.values() for name, account_id in accounts.items()
+    }
     actual_output = account_ids.account_ids_from_name(
         deployment_target_accounts=deployment_target_accounts,
-        ou_org_accounts=ou_with_all_accounts
+        account_ids_by_name=account_ids_by_name
     )
     assert actual_output == {'Audit': '000000000000'}
 
@@ -71,11 +109,23 @@ def test_multi_account_id_from_name():
         file_name_with_ext="ou_with_all_accounts.json",
         is_json_file=True
     )
+    account_ids_by_name = {
+        name: account_id for accounts in ou_with_all_accounts.values() for name, account_id in accounts.items()
+    }
     actual_output = account_ids.account_ids_from_name(
         deployment_target_accounts=deployment_target_accounts,
-        ou_org_accounts=ou_with_all_accounts
+        account_ids_by_name=account_ids_by_name
     )
     assert actual_output == {'Management': '123456789012', 'Audit': '000000000000'}
+    assert deployment_target_accounts == ["Management", "Audit"]
+
+
+def test_account_id_from_name_not_found():
+    actual_output = account_ids.account_ids_from_name(
+        deployment_target_accounts=["Audit", "TestWorkload"],
+        account_ids_by_name={'Audit': '000000000000'}
+    )
+    assert actual_output == {'Audit': '000000000000'}
 
 
 def test_create_provider_block_no_management():
@@ -133,6 +183,23 @@ def test_get_all_accounts():
     actual_output = account_ids.get_all_accounts(org_client=mock_org_client)
 
     assert actual_output == expected_output
+    mock_paginator.paginate.assert_called_once_with(PaginationConfig={'PageSize': 20})
+
+
+def test_get_all_regions_is_cached():
+    mock_ec2_client = Mock()
+    mock_ec2_client.describe_regions.return_value = {
+        'Regions': [{'RegionName': 'eu-west-1'}, {'RegionName': 'eu-west-2'}]
+    }
+    account_ids.get_all_regions.cache_clear()
+    with patch.object(account_ids.boto3, "client", return_value=mock_ec2_client) as mock_client:
+        first_output = account_ids.get_all_regions()
+        second_output = account_ids.get_all_regions()
+    account_ids.get_all_regions.cache_clear()
+
+    assert first_output == second_output == ['eu-west-1', 'eu-west-2']
+    mock_client.assert_called_once_with('ec2')
+    mock_ec2_client.describe_regions.assert_called_once()
 
 
 def test_create_module():
@@ -173,3 +240,289 @@ def test_create_module():
     )
 
     assert actual_output == expected_output
+
+
+def test_create_module_with_dependencies():
+    actual_output = account_ids.create_module_code(
+        module_name="module-b",
+        module_source="github.com/cloudscaler/module-b",
+        deployment_account_ids={'Audit': '000000000000', 'Backups': '333333333333'},
+        regions=["eu-west-1", "eu-west-2"],
+        variables=[],
+        module_dependencies=["module-a"]
+    )
+
+    assert actual_output.count("  depends_on = [ module.module-a-eu-west-1 ]\n") == 2
+    assert actual_output.count("  depends_on = [ module.module-a-eu-west-2 ]\n") == 2
+
+
+def test_get_all_accounts_recursive():
+    accounts_by_parent = {
+        'r-abcd': [{'Name': 'Management', 'Id': '123456789012'}],
+        'ou-work': [],
+        'ou-dev': [{'Name': 'TestWorkload', 'Id': '666666666666'}],
+        'ou-pro': [{'Name': 'TestProdWorkload', 'Id': '777777777777'}]
+    }
+    ous_by_parent = {
+        'r-abcd': [{'Id': 'ou-work', 'Name': 'Workloads'}],
+        'ou-work': [{'Id': 'ou-dev', 'Name': 'Dev'}, {'Id': 'ou-pro', 'Name': 'Pro'}],
+        'ou-dev': [],
+        'ou-pro': []
+    }
+    mock_org_client = mock_org_client_for_tree(accounts_by_parent, ous_by_parent)
+
+    actual_output = account_ids.get_all_accounts_recursive(
+        org_client=mock_org_client,
+        parent_id='r-abcd',
+        name=account_ids.NAME_OF_OU_ROOT,
+        accounts_by_ou={}
+    )
+
+    assert actual_output == {
+        'root': {'Management': '123456789012'},
+        'Workloads': {},
+        'Workloads/Dev': {'TestWorkload': '666666666666'},
+        'Workloads/Pro': {'TestProdWorkload': '777777777777'}
+    }
+    mock_org_client.list_children.assert_not_called()
+
+
+def test_get_all_accounts_recursive_order_is_stable():
+    accounts_by_parent = {
+        'r-abcd': [{'Name': 'Management', 'Id': '123456789012'}],
+        'ou-sec': [{'Name': 'Audit', 'Id': '000000000000'}],
+        'ou-work': [],
+        'ou-dev': [{'Name': 'TestWorkload', 'Id': '666666666666'}],
+        'ou-pro': [{'Name': 'TestProdWorkload', 'Id': '777777777777'}]
+    }
+    ous_by_parent = {
+        'r-abcd': [{'Id': 'ou-sec', 'Name': 'Security'}, {'Id': 'ou-work', 'Name': 'Workloads'}],
+        'ou-sec': [],
+        'ou-work': [{'Id': 'ou-dev', 'Name': 'Dev'}, {'Id': 'ou-pro', 'Name': 'Pro'}],
+        'ou-dev': [],
+        'ou-pro': []
+    }
+    expected_order = ['root', 'Security', 'Workloads', 'Workloads/Dev', 'Workloads/Pro']
+    # Earlier siblings are made slower than later ones, so the calls complete out of tree order
+    for delays_by_parent in [{}, {'ou-sec': 0.05, 'ou-dev': 0.03}, {'ou-work': 0.02, 'ou-dev': 0.05}]:
+        actual_output = account_ids.get_all_accounts_recursive(
+            org_client=mock_org_client_for_tree(accounts_by_parent, ous_by_parent, delays_by_parent),
+            parent_id='r-abcd',
+            name=account_ids.NAME_OF_OU_ROOT,
+            accounts_by_ou={}
+        )
+
+        assert list(actual_output) == expected_order
+
+
+def test_filter_excluded_accounts():
+    ou_with_all_accounts = load_file_from_path(
+        file_name_with_ext="ou_with_all_accounts.json",
+        is_json_file=True
+    )
+    actual_output = account_ids.filter_excluded_accounts(
+        org_account_list=ou_with_all_accounts,
+        excluded_accounts=['Audit', 'Workloads/Dev']
+    )
+
+    assert actual_output['Workloads/Dev'] == {}
+    assert not any('Audit' in accounts for accounts in actual_output.values())
+    assert 'TestProdWorkload' in actual_output['Workloads/Pro']
+    # The original dict must be left untouched so other modules can still deploy to excluded accounts
+    assert ou_with_all_accounts['Workloads/Dev'] != {}
+
+
+def test_load_configuration():
+    yaml_file_name = os.path.join(os.path.dirname(__file__), "..", account_ids.DEBUG_YAML_FILE_NAME)
+    actual_output = account_ids.load_configuration(yaml_file_name=yaml_file_name)
+
+    assert isinstance(actual_output, dict)
+    assert actual_output['terraformModules'][0]['name'] == "elz-observability-core"
+
+
+def test_load_configuration_comment_only_file(tmp_path):
+    comment_only_file = tmp_path / "comment-only.yaml"
+    comment_only_file.write_text("# terraformModules:\n#   - name: elz-observability-core\n", encoding='us-ascii')
+    empty_document_file = tmp_path / "empty-document.yaml"
+    empty_document_file.write_text("---\n", encoding='us-ascii')
+
+    assert account_ids.load_configuration(yaml_file_name=str(comment_only_file)) == {}
+    assert account_ids.load_configuration(yaml_file_name=str(empty_document_file)) == {}
+
+
+def test_format_value_nested_list():
+    parts = ["value = "]
+    account_ids.format_value([{'name': 'a', 'ports': [80, 443]}, ['module.b.id']], parts)
+    actual_output = "".join(parts)
+
+    assert actual_output == (
+        "value = "
+        "[\n"
+        "    {\n"
+        "      name = \"a\"\n"
+        "      ports = [80, 443]\n"
+        "    },\n"
+        "    [module.b.id]\n"
+        "  ]"
+    )
+
+
+def test_format_value_scalars():
+    parts = []
+    for value in [True, 1, "eu-west-2", "module.b.id", False, 0]:
+        account_ids.format_value(value, parts)
+
+    assert parts == ["true", "1", "\"eu-west-2\"", "module.b.id", "false", "0"]
+
+
+def test_format_value_unsupported_type():
+    for value in [{'a', 'b'}, None, 1.5]:
+        with pytest.raises(TypeError, match="Unsupported type"):
+            account_ids.format_value(value, [])
+
+
+def test_deploy_targets_creates_provider_code_once():
+    ou_with_all_accounts = load_file_from_path(
+        file_name_with_ext="ou_with_all_accounts.json",
+        is_json_file=True
+    )
+    tf_modules = [
+        {
+            'name': 'module-a',
+            'source': 'github.com/cloudscaler/module-a',
+            'deploymentTargets': {'accounts': ['Audit']},
+            'regions': ['eu-west-2']
+        },
+        {
+            'name': 'module-b',
+            'source': 'github.com/cloudscaler/module-b',
+            'deploymentTargets': {'organizationalUnits': ['Workloads/Pro']},
+            'regions': ['eu-west-1', 'eu-west-2'],
+            'dependsOn': ['module-a']
+        }
+    ]
+    with patch.object(account_ids, "get_all_accounts_recursive", return_value=ou_with_all_accounts), \
+            patch.object(account_ids, "create_module_code") as mock_create_module_code, \
+            patch.object(account_ids, "create_provider_code") as mock_create_provider_code, \
+            patch.object(account_ids, "write_files") as mock_write_files:
+        account_ids.deploy_targets(org_client=Mock(), tf_modules=tf_modules, root_id="r-abcd")
+
+    assert mock_create_module_code.call_count == 2
+    assert mock_create_module_code.call_args_list[1].kwargs['deployment_account_ids'] == {
+        'TestProdWorkload': '777777777777'
+    }
+    mock_create_provider_code.assert_called_once()
+    assert mock_create_provider_code.call_args.kwargs['regions'] == ['eu-west-1', 'eu-west-2']
+    mock_write_files.assert_called_once()
+    assert set(mock_write_files.call_args.args[0]) == {
+        'terraform/module-a.tf', 'terraform/module-b.tf', 'terraform/provider.tf'
+    }
+
+
+def test_write_files(tmp_path):
+    files = {
+        str(tmp_path / "terraform" / "provider.tf"): 'provider "aws" {}\n',
+        str(tmp_path / "terraform" / "module-a.tf"): 'module "module-a" {}\n'
+    }
+    account_ids.write_files(files)
+
+    for output_file, content in files.items():
+        with open(output_file, 'r', encoding='us-ascii') as file:
+            assert file.read() == content
+
+
+def test_deploy_targets_follows_yaml_target_order():
+    ou_with_all_accounts = load_file_from_path(
+        file_name_with_ext="ou_with_all_accounts.json",
+        is_json_file=True
+    )
+    tf_modules = [
+        {
+            'name': 'module-a',
+            'source': 'github.com/cloudscaler/module-a',
+            'deploymentTargets': {
+                'accounts': ['Audit'],
+                'excludedAccounts': [],
+                'organizationalUnits': ['Workloads/Pro']
+            },
+            'regions': ['eu-west-2']
+        }
+    ]
+    with patch.object(account_ids, "get_all_accounts_recursive", return_value=ou_with_all_accounts), \
+            patch.object(account_ids, "create_module_code") as mock_create_module_code, \
+            patch.object(account_ids, "write_files"):
+        account_ids.deploy_targets(org_client=Mock(), tf_modules=tf_modules, root_id="r-abcd")
+
+    assert list(mock_create_module_code.call_args.kwargs['deployment_account_ids']) == ['Audit', 'TestProdWorkload']
+
+
+def test_deploy_targets_unknown_dependency():
+    ou_with_all_accounts = load_file_from_path(
+        file_name_with_ext="ou_with_all_accounts.json",
+        is_json_file=True
+    )
+    tf_modules = [
+        {
+            'name': 'module-a',
+            'source': 'github.com/cloudscaler/module-a',
+            'deploymentTargets': {'accounts': ['Audit']},
+            'regions': ['eu-west-2'],
+            'dependsOn': ['module-missing']
+        }
+    ]
+    with patch.object(account_ids, "get_all_accounts_recursive", return_value=ou_with_all_accounts), \
+            patch.object(account_ids, "write_files") as mock_write_files:
+        account_ids.deploy_targets(org_client=Mock(), tf_modules=tf_modules, root_id="r-abcd")
+
+    mock_write_files.assert_not_called()
+
+
+def test_write_to_file_skips_unchanged_content(tmp_path):
+    output_file = str(tmp_path / "terraform" / "provider.tf")
+    account_ids.write_to_file('provider "aws" {}\n', output_file)
+    os.utime(output_file, ns=(0, 0))
+
+    account_ids.write_to_file('provider "aws" {}\n', output_file)
+    assert os.stat(output_file).st_mtime_ns == 0
+
+    account_ids.write_to_file('provider "aws" {\n}\n', output_file)
+    assert os.stat(output_file).st_mtime_ns != 0
+    with open(output_file, 'r', encoding='us-ascii') as file:
+        assert file.read() == 'provider "aws" {\n}\n'
+
+
+def test_deploy_targets_provider_code_is_stable():
+    accounts_by_parent = {
+        'r-abcd': [{'Name': 'Management', 'Id': '123456789012'}],
+        'ou-sec': [{'Name': 'Audit', 'Id': '000000000000'}, {'Name': 'LogArchive', 'Id': '999999999999'}],
+        'ou-work': [{'Name': 'TestWorkload', 'Id': '666666666666'}],
+        'ou-pro': [{'Name': 'TestProdWorkload', 'Id': '777777777777'}]
+    }
+    ous_by_parent = {
+        'r-abcd': [{'Id': 'ou-sec', 'Name': 'Security'}, {'Id': 'ou-work', 'Name': 'Workloads'}],
+        'ou-sec': [],
+        'ou-work': [{'Id': 'ou-pro', 'Name': 'Pro'}],
+        'ou-pro': []
+    }
+    regions = ['eu-west-2', 'us-east-1', 'eu-west-1', 'ap-southeast-2']
+    provider_codes = set()
+    # The OU calls complete in a different order each run, and the modules list their regions in a different order
+    for run, delays_by_parent in enumerate([{}, {'ou-sec': 0.05}, {'ou-work': 0.05, 'ou-pro': 0.02}]):
+        tf_modules = [
+            {'name': 'module-a', 'source': 'a', 'deploymentTargets': {'accounts': ['Audit']},
+             'regions': regions[run:] + regions[:run]},
+            {'name': 'module-b', 'source': 'b', 'deploymentTargets': {'organizationalUnits': ['Workloads/Pro']},
+             'regions': list(reversed(regions[:run + 1]))}
+        ]
+        with patch.object(account_ids, "write_files") as mock_write_files:
+            account_ids.deploy_targets(
+                org_client=mock_org_client_for_tree(accounts_by_parent, ous_by_parent, delays_by_parent),
+                tf_modules=tf_modules,
+                root_id="r-abcd"
+            )
+        provider_codes.add(mock_write_files.call_args.args[0]['terraform/provider.tf'])
+
+    assert len(provider_codes) == 1
+    provider_code = provider_codes.pop()
+    region_positions = [provider_code.index(f'region = "{region}"') for region in sorted(regions)]
+    assert region_positions == sorted(region_positions)